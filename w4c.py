@@ -45,6 +45,13 @@ import os
 
 from wordfile import *
 import wordfingerprint as wordfp
+import wordindex as wordidx
+import wordwatch
+import wordlayout
+import wordcolumns
+import wordprefetch
+import wordbackground
+import wordbulk
 
 class Correlator:
     """
@@ -55,6 +62,19 @@ class Correlator:
     refdocfp  = None
     tstdocfp  = None
     verbosity = 4
+    index     = None
+    shard     = None
+    builds    = (0, 0xffffffff)
+    bitsmode  = False
+    distance  = 0
+    interval  = 1.0
+    queue     = None
+    layout    = False
+    depth     = 0
+    buffers   = wordprefetch.BUFFERS
+    background = None
+    bulk      = False
+    tree      = None
 
     def setdoc(self, docname, isref=False):
         """
@@ -92,6 +112,15 @@ class Correlator:
         :return: string describing validation result
         """
         valid = self.refdocfp.wfile.valid_doc() if isref else self.tstdocfp.wfile.valid_doc()
+        return self.validity(valid)
+
+    @staticmethod
+    def validity(valid):
+        """
+        describe basic ole2 stream validation result
+        :param valid: boolean
+        :return: string describing validation result
+        """
         return 'valid MS-Word/OLE2 document' if valid else 'NOT valid MS-Word/OLE2 document'
 
     def cancorrelate(self):
@@ -112,15 +141,41 @@ class Correlator:
         # percent calc init
         total = ok = 0
         for key in self.refdocfp.formula:
-            total += 1
             ref = self.refdocfp._eval_key(key)
             tst = self.tstdocfp._eval_key(key)
-            if ref == tst: ok += 1
-            # stdout - details about matching per key
-            self.printout(5, '%30s 0x%06x 0x%06x %s'  % (key, ref, tst, 'match' if ref == tst else '< diff'))
+            width = self.refdocfp.key_bits(key)
+            diff = wordfp.popcount((ref ^ tst) & ((1 << width) - 1))
+            if self.bitsmode:
+                total += width
+                ok += width - diff
+            else:
+                total += 1
+                if ref == tst: ok += 1
+            # stdout - details about matching per key [number of different bits in bits mode]
+            result = 'match' if ref == tst else '< diff'
+            if self.bitsmode and ref != tst: result += ' %d bits' % diff
+            self.printout(5, '%30s 0x%06x 0x%06x %s'  % (key, ref, tst, result))
         # calc percentage
         return 100.0*ok/total if total>0 else 0
 
+    def background_formula(self):
+        """
+        background model has to be built for current fingerprint formula, frequencies of other formula are meaningless
+        :return: boolean
+        """
+        if self.background is None or self.background.formula == list(wordfp.WordFingerprint.formula):
+            return True
+        print 'ERROR: background model is built for fingerprint %s, not %s' % (
+            ','.join(self.background.formula), ','.join(wordfp.WordFingerprint.formula))
+        return False
+
+    def matching_keys(self):
+        """
+        formula keys with the same value in ref.doc and tested.doc
+        :return: list of keys
+        """
+        return [key for key in self.refdocfp.formula if self.refdocfp._eval_key(key) == self.tstdocfp._eval_key(key)]
+
     def correlate(self):
         """
         main method for console (non GUI) correlation - contains flow and stdout printouts status
@@ -143,7 +198,203 @@ class Correlator:
         self.printout(3, 'Tested/DUT document fingerprint: %s'   % (self.getfingerprint(isref=False)))
         #
         if self.cancorrelate():
-            self.printout(1, '\nInspected/DUT doc fingerprint is matching REF/reference doc fingerprint for %.2f%%' % self.percent_match())
+            self.printmatch(self.percent_match(), self.matching_keys)
+        return
+
+    def printmatch(self, percent, keys):
+        """
+        print correlation result and random match probability when background model is used
+        :param percent: float percentage correlation match
+        :param keys: function returning matched formula keys [evaluated only for background model]
+        :return:
+        """
+        self.printout(1, '\nInspected/DUT doc fingerprint is matching REF/reference doc fingerprint for %.2f%%' % percent)
+        if self.background is not None:
+            p = self.background.probability(self.refdocfp, keys())
+            self.printout(1, 'Random match probability %.3g, likelihood ratio %.3g [background of %d documents]' % (
+                p, 1 / p, self.background.total))
+        return
+
+    def correlate_batch(self, decoder, chunk, records, valid):
+        """
+        correlate bulk decoded batch to reference doc - percentages and validity are evaluated vectorized
+        on record columns, no fingerprint is built per doc [per-key table and hexdump need per doc path]
+        :param decoder: BulkDecoder instance
+        :param chunk: batch filenames
+        :param records: decoded batch
+        :param valid: numpy boolean array of valid docs
+        :return:
+        """
+        formula = self.refdocfp.formula
+        percents,matches = decoder.percent_match(records, self.refdocfp, self.bitsmode)
+        values = [decoder.eval_key(records, key) for key in formula]
+        for i,docname in enumerate(chunk):
+            if i in decoder.errors: print decoder.errors[i]
+            self.printout(2, '\nReference  document %s' % (self.refdocfp.fname))
+            self.printout(4, 'Validate REF/reference doc: %s\n' % self.getvalidity(isref=True))
+            self.printout(2, 'Tested/DUT document %s' % docname)
+            self.printout(4, 'Validate DUT/tested doc: %s\n' % self.validity(valid[i]))
+            self.printout(3, '\nReference  document fingerprint: %s' % (self.getfingerprint(isref=True)))
+            self.printout(3, 'Tested/DUT document fingerprint: %s' % '-'.join(['%04x' % v[i] for v in values]))
+            self.printmatch(percents[i], lambda: [key for key,match in zip(formula, matches) if match[i]])
+        return
+
+    def inspect(self, docname, fp=None):
+        """
+        process inspected doc - add fingerprint to index and correlate to reference doc if any
+        :param docname: document filename
+        :param fp: WordFingerprint of already read doc [prefetched]
+        :return:
+        """
+        if not wordidx.in_shard(docname, self.shard):
+            self.printout(5, 'Skipped document %s - not in shard %d/%d' % ((docname,) + self.shard))
+            return
+        if fp is None:
+            self.setdoc(docname, isref=False)
+        else:
+            self.tstdocfp = fp
+        if self.index is not None:
+            try:
+                if self.index.add(self.tstdocfp):
+                    self.printout(2, 'Indexed document %s' % docname)
+            except (IOError, OSError) as e:
+                # unreadable doc is not indexed, the rest of the run and its index are kept
+                print e
+                self.printout(2, 'NOT indexed document %s' % docname)
+        if self.refdocfp is not None:
+            self.correlate()
+        return
+
+    def scan(self, docname):
+        """
+        inspect doc now or queue it for disk layout ordered inspection
+        :param docname: document filename
+        :return:
+        """
+        if self.queue is None or docname == wordfp.STDIN:
+            self.inspect(docname)
+        elif wordidx.in_shard(docname, self.shard):
+            # docs of other shards are not queued, so no disk layout lookups or reads are done for them
+            self.queue.append(docname)
+        return
+
+    def flush(self):
+        """
+        inspect queued docs - in disk layout order and/or read by concurrent prefetching reader or bulk decoder
+        :return:
+        """
+        if not self.queue: return
+        docs = self.queue
+        if self.depth > 0:
+            # layout only orders submission of reads [concurrent reads complete out of order, no read ahead hints],
+            # md5 of whole doc is read only when it goes to index
+            if self.layout:
+                docs = wordlayout.disk_order(docs)
+            pf = wordprefetch.Prefetcher(self.depth, self.buffers, digest=self.index is not None)
+            for docname,head,digest,error in pf.fetch(docs):
+                if error: print error
+                fp = wordfp.WordFingerprint()
+                fp.header(docname, head, digest)
+                self.inspect(docname, fp)
+        elif self.bulk:
+            if self.layout:
+                docs = wordlayout.disk_order(docs)
+            decoder = wordbulk.BulkDecoder()
+            for chunk,records,valid in decoder.batches(docs):
+                self.printout(4, 'Bulk decoded %d documents, %d valid' % (len(chunk), valid.sum()))
+                # index needs md5 of every doc, per-key table and hexdump need its fingerprint
+                if self.refdocfp is not None and self.index is None and self.verbosity < 5:
+                    self.correlate_batch(decoder, chunk, records, valid)
+                    continue
+                for i,docname in enumerate(chunk):
+                    if i in decoder.errors: print decoder.errors[i]
+                    fp = wordfp.WordFingerprint()
+                    fp.header(docname, None)
+                    fp.wfile.doc = decoder.fields(records, i)
+                    self.inspect(docname, fp)
+        else:
+            # read ahead hints are issued lazily while docs are inspected
+            if self.layout:
+                docs = wordlayout.ordered(docs, WordFile.header_size())
+            for docname in docs:
+                self.inspect(docname)
+        self.queue = []
+        return
+
+    def timeline(self, indexfile):
+        """
+        print installation timeline of index or with reference doc only its installation documents within builds range
+        :param indexfile: index filename
+        :return:
+        """
+        tl = wordidx.BuildTimeline(wordidx.WordIndex.load(indexfile))
+        lo,hi = self.builds
+        if self.refdocfp is not None:
+            self.printout(2, '\nReference  document %s' % (self.refdocfp.fname))
+            self.printout(1, 'Documents from the same installation saved by builds 0x%x..0x%x:' % (lo, hi))
+            for e in tl.between({'fields': self.refdocfp.wfile.doc}, lo, hi):
+                self.printout(1, '    saved.build 0x%08x created.build 0x%08x %s' % (
+                    e['fields'].get(KEY_SAVED_BUILD, 0), e['fields'].get(KEY_CREATED_BUILD, 0), e['path']))
+            return
+        for inst,clusters in tl.timeline():
+            clusters = [c for c in clusters if lo <= c[0] <= hi]
+            if not clusters: continue
+            self.printout(1, '\nInstallation %s' % ' '.join(['%s 0x%04x' % kv for kv in zip(tl.installation_keys, inst)]))
+            for build,entries,bridged in clusters:
+                self.printout(1, '    %s saved.build 0x%08x %5d documents%s' % (
+                    '->' if clusters[0][0] != build else '  ', build, len(entries),
+                    ' [bridged by created.build]' if bridged else ''))
+                for e in entries:
+                    self.printout(3, '%36s %s' % ('', e['path']))
+        return
+
+    def near(self, indexfile=None):
+        """
+        print index documents with packed fingerprint within distance bits of reference doc fingerprint,
+        tree of index is kept loaded for queries of following reference docs
+        :param indexfile: index filename to load, None to query already loaded index
+        :return:
+        """
+        if indexfile is not None:
+            self.tree = wordidx.BKTree.for_index(indexfile)
+        bits,width = self.refdocfp.fp_bits()
+        self.printout(2, '\nReference  document %s' % (self.refdocfp.fname))
+        self.printout(1, 'Documents with fingerprint within %d of %d bits:' % (self.distance, width))
+        for d,path in self.tree.search(bits, self.distance):
+            self.printout(1, '    %3d bits %6.2f%% %s' % (d, 100.0*(width - d)/width if width else 0, path))
+        return
+
+    def columns(self, colfile):
+        """
+        correlate reference doc to all documents of memory mapped columnar file
+        :param colfile: columnar filename
+        :return:
+        """
+        cols = wordcolumns.ColumnFile(colfile)
+        percent = cols.percent_match(self.refdocfp, self.bitsmode)
+        self.printout(2, '\nReference  document %s' % (self.refdocfp.fname))
+        self.printout(1, 'Documents of %s fingerprint matching REF/reference doc fingerprint:' % colfile)
+        for i in sorted(range(len(cols)), key=lambda i: -percent[i]):
+            self.printout(1, '    %6.2f%% %s %s' % (percent[i], cols.md5(i), cols.path(i)))
+        cols.close()
+        return
+
+    def watch(self, directory):
+        """
+        inspect new or changed files landing in intake directory until interrupted
+        :param directory: intake directory
+        :return:
+        """
+        watcher = wordwatch.Watcher(directory, self.interval)
+        self.printout(2, 'Watching %s [%s], press Ctrl-C to stop' % (directory, 'inotify' if watcher.inotify() else 'polling'))
+        sys.stdout.flush()
+        try:
+            for path in watcher.changes():
+                self.inspect(path)
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+        watcher.close()
         return
 
     def printout(self, level, msg):
@@ -165,19 +416,50 @@ class Correlator:
         :return:
         """
         list_keys = [', '.join(l) for s,l in WordFile.known_keys.items()]
+        prog = os.path.basename(argv[0])
         print """
         (c) 2015 W4C = MS Word Forensic Correlator [wor-for-cor] console version %s by %s
 
         W4C correlates some internal MS-word doc structures to calculate percentage of probability that
         document under test [test.doc] was edited with the same MS-word version as reference doc [ref.doc]
 
-        usage: %s [-help ][-verbosity int ][-fingerprint csv ] -ref ref.doc test.doc
+        usage: %s [-help ][-verbosity int ][-fingerprint csv ][-shard i/n ][-index out.idx ][-layout ][-prefetch depth ][-bulk ][-background model.bg ] -ref ref.doc test.doc
+               %s -merge out.idx part1.idx part2.idx ...
+               %s [-builds lo:hi ][-ref ref.doc ] -timeline case.idx
+               %s [-distance bits ] -ref ref.doc -near case.idx [-ref ref2.doc ...]
+               %s [-interval sec ][-index out.idx ] -ref ref.doc -watch intake.dir
+               %s -export case.idx out.w4cc
+               %s [-similarity bits ] -ref ref.doc -columns case.w4cc
+               %s -population case.idx model.bg
 
         help            ... show this usage help
         verbosity int   ... optional - set level of verbosity to integer value [default 3]
         fingerprint csv ... optional - use csv fields to calculate fingerprint [see bellow for defaults]
+        shard i/n       ... optional - process only i-th of n shards of documents [by path hash]
+        index out.idx   ... optional - write fingerprints of inspected documents to index file [-ref is then optional]
+        manifest file   ... optional - inspect documents listed in file [one filename per line]
+        layout          ... optional - inspect documents in physical disk order [faster on spinning disks]
+        prefetch depth  ... optional - read documents concurrently with depth reads in flight [network storage]
+                            output is in completion order, with layout only reads are submitted in disk order
+        buffers n       ... optional - max read documents waiting for correlation with prefetch [default 64]
+        bulk            ... optional - decode documents in batches with numpy [numpy required]
+        merge out.idx   ... merge partial index files into out.idx [deduplicated by path and md5]
+        timeline idx    ... print installation timeline of index [with -ref only documents of ref.doc installation]
+        builds lo:hi    ... optional - limit timeline to saved.build range [hexa 0x... or decimal]
+        similarity mode ... optional - fields = percentage of matching fields [default], bits = percentage of matching bits
+        near idx        ... list documents of index with fingerprint within distance bits of ref.doc fingerprint
+                            [and of every following -ref doc, tree is cached in idx.bkt]
+        distance bits   ... optional - max number of different bits for near [default 0]
+        watch dir       ... inspect new or changed documents landing in directory until Ctrl-C
+        interval sec    ... optional - seconds watched file size has to be stable [default 1.0]
+        export idx out  ... export index file to binary columnar file
+        columns file    ... correlate ref.doc to all documents of binary columnar file
+        population i m  ... build background model m of value frequencies [current formula] from population index i
+        background m    ... optional - show random match probability of correlation based on background model m
+                            [model has to be built for the same fingerprint formula]
         ref ref.doc     ... reference ms word document
         test.doc        ... inspected documents under test will be correlated to reference one
+                            use - instead of ref.doc or test.doc to read document from stdin (pipe)
 
         Default fingerprint formula definition:
         %s
@@ -192,7 +474,12 @@ class Correlator:
         -v = -verbosity
         -f = -fingerprint
         -r = -ref
-        """ % (__version__, __author__, os.path.basename(argv[0]), wordfp.WordFingerprint.get_formula(','), ', '.join(list_keys))
+        -s = -shard
+        -i = -index
+        -l = -layout
+        -p = -prefetch
+        -b = -bulk
+        """ % ((__version__, __author__) + (prog,) * 8 + (wordfp.WordFingerprint.get_formula(','), ', '.join(list_keys)))
         sys.exit(1)
         return
 
@@ -203,13 +490,14 @@ class Correlator:
         :param argv:
         :return:
         """
-        # min 1+3 arguments: $0 -ref ref.doc test.doc
-        if len(argv) < 4:
+        # min 1+2 arguments: $0 -timeline case.idx
+        if len(argv) < 3:
             cls.usage(argv)
 
         # console correlator
         cor = Correlator()
         ref = None
+        indexfile = None
 
         # parse arguments
         it = iter(argv[1:])
@@ -233,21 +521,157 @@ class Correlator:
             if par in ['-f', '-fingerprint']:
                 csv = next(it)
                 wordfp.WordFingerprint.set_formula( [x.strip() for x in csv.split(',')] )
+                if not cor.background_formula():
+                    cls.usage(argv)
+                continue
+
+            # shard i/n
+            if par in ['-s', '-shard']:
+                cor.shard = wordidx.parse_shard(next(it))
+                continue
+
+            # index file
+            if par in ['-i', '-index']:
+                indexfile = next(it)
+                cor.index = wordidx.WordIndex()
+                continue
+
+            # merge partial index files
+            if par in ['-merge']:
+                files = list(it)
+                if len(files) < 2:
+                    cls.usage(argv)
+                idx = wordidx.WordIndex.merge_files(files[1:])
+                idx.save(files[0])
+                cor.printout(2, 'Merged %d index files into %s with %d documents' % (len(files) - 1, files[0], len(idx)))
+                return
+
+            # saved build range
+            if par in ['-builds']:
+                cor.builds = wordidx.parse_builds(next(it))
+                continue
+
+            # export index to columnar file
+            if par in ['-export']:
+                indexfile,colfile = next(it),next(it)
+                rows = wordcolumns.write_columns(colfile, wordidx.WordIndex.load(indexfile))
+                cor.printout(2, 'Exported %d documents from %s to %s' % (rows, indexfile, colfile))
+                return
+
+            # build background model
+            if par in ['-population']:
+                indexfile,modelfile = next(it),next(it)
+                model = wordbackground.BackgroundModel.from_index(wordidx.WordIndex.load(indexfile), wordfp.WordFingerprint.formula)
+                model.save(modelfile)
+                cor.printout(2, 'Saved background model %s of %d documents from %s' % (modelfile, model.total, indexfile))
+                return
+
+            # background model
+            if par in ['-background']:
+                cor.background = wordbackground.BackgroundModel.load(next(it))
+                if not cor.background_formula():
+                    cls.usage(argv)
+                continue
+
+            # installation timeline
+            if par in ['-timeline']:
+                cor.timeline(next(it))
+                return
+
+            # similarity mode
+            if par in ['-similarity']:
+                mode = next(it)
+                if mode not in ['fields', 'bits']:
+                    cls.usage(argv)
+                cor.bitsmode = mode == 'bits'
+                continue
+
+            # max hamming distance
+            if par in ['-distance']:
+                cor.distance = int(next(it))
+                continue
+
+            # watch stable interval
+            if par in ['-interval']:
+                cor.interval = float(next(it))
+                continue
+
+            # disk layout order
+            if par in ['-l', '-layout']:
+                cor.layout = True
+                cor.queue = cor.queue or []
+                continue
+
+            # concurrent prefetching reader
+            if par in ['-p', '-prefetch']:
+                cor.depth = int(next(it))
+                cor.queue = cor.queue or []
+                continue
+
+            # bulk decoder
+            if par in ['-b', '-bulk']:
+                if wordbulk.numpy is None:
+                    print 'ERROR: -bulk requires numpy'
+                    cls.usage(argv)
+                cor.bulk = True
+                cor.queue = cor.queue or []
+                continue
+
+            # max prefetched buffers
+            if par in ['-buffers']:
+                cor.buffers = int(next(it))
                 continue
 
             # ref doc
             if par in ['-r', '-ref', '-reference', '-m', '-master']:
+                cor.flush()
                 ref = next(it)
                 cor.setdoc(ref, isref=True)
+                if cor.tree is not None:
+                    cor.near()
                 continue
 
             # test doc
-            if ref is None:
+            if ref is None and cor.index is None:
                 cls.usage(argv)
 
+            # correlate to columnar file
+            if par in ['-columns']:
+                if ref is None:
+                    cls.usage(argv)
+                cor.columns(next(it))
+                return
+
+            # near neighbours in index
+            if par in ['-near']:
+                if ref is None:
+                    cls.usage(argv)
+                cor.near(next(it))
+                continue
+
+            # intake directory
+            if par in ['-watch']:
+                cor.flush()
+                cor.watch(next(it))
+                continue
+
+            # test docs listed in manifest
+            if par in ['-manifest']:
+                for doc in wordidx.read_manifest(next(it)):
+                    cor.scan(doc)
+                continue
+
             # correlate
-            cor.setdoc(par, isref=False)
-            cor.correlate()
+            cor.scan(par)
+
+        # queued docs
+        cor.flush()
+
+        # write index
+        if cor.index is not None:
+            cor.index.shard = cor.shard
+            cor.index.save(indexfile)
+            cor.printout(2, 'Saved index %s with %d documents' % (indexfile, len(cor.index)))
 
         return
 
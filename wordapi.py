@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+
+"""
+==========
+ Word API
+==========
+
+Word API is library module of W4C = Word Forensic Correlator = wor-for-cor = wor4cor = w4c
+
+Batched fingerprinting and correlation for embedding in forensic pipelines. Functions
+print nothing and keep no global state - formula is passed per call, errors are returned
+as part of results. Parser and read buffers are reused per thread, so functions could be
+called from many threads at once.
+
+    import wordapi
+
+    refs  = wordapi.fingerprint_many(['ref.doc'])
+    tests = wordapi.fingerprint_many(['a.doc', 'b.doc'])
+    for r in wordapi.correlate_many(refs, tests):
+        print r.ref, r.test, r.percent
+
+"""
+
+__author__  = 'Robert'
+__email__   = 'robert.puskajler@yahoo.ca'
+__version__ = '2.0.1'
+
+import collections
+import hashlib
+import threading
+
+from wordfile import *
+import wordfingerprint as wordfp
+
+# default formula, copied so later WordFingerprint.set_formula() has no effect on library calls
+DEFAULT_FORMULA = tuple(wordfp.WordFingerprint.formula)
+
+# md5 read block size
+BLOCK = 65536
+
+# error: exception class name and message
+Error = collections.namedtuple('Error', 'kind message')
+
+# fingerprint of one source: values are evaluated formula keys in formula order
+FingerprintResult = collections.namedtuple('FingerprintResult', 'source md5 valid values error')
+
+# correlation of one ref/test pair: percent of matching keys [or bits], error of ref or test
+CorrelationResult = collections.namedtuple('CorrelationResult', 'ref test percent matched total error')
+
+# per thread parser and buffers
+_local = threading.local()
+
+
+def _formula(formula):
+    """
+    normalize formula
+    :param formula: list of keys, csv string or None for default
+    :return: tuple of keys
+    """
+    if formula is None: return DEFAULT_FORMULA
+    if isinstance(formula, basestring):
+        formula = formula.split(',')
+    return tuple([key.strip() for key in formula])
+
+def _parser():
+    """
+    thread local parser and buffers, created on first use in thread
+    :return: tuple (WordFingerprint, header bytearray, block bytearray)
+    """
+    if not hasattr(_local, 'fp'):
+        _local.fp = wordfp.WordFingerprint()
+        _local.fp.wfile = WordFile(None)
+        _local.head = bytearray(WordFile.header_size())
+        _local.block = bytearray(BLOCK)
+    return _local.fp, _local.head, _local.block
+
+def _readinto(f, buff):
+    """
+    fill buffer from stream, short reads are repeated
+    :param f: binary stream
+    :param buff: bytearray
+    :return: number of bytes read [less than buffer size only at end of stream]
+    """
+    view = memoryview(buff)
+    got = 0
+    while got < len(buff):
+        if hasattr(f, 'readinto'):
+            n = f.readinto(view[got:])
+        else:
+            chunk = f.read(len(buff) - got)
+            n = len(chunk)
+            buff[got:got + n] = chunk
+        if not n: break
+        got += n
+    return got
+
+def _fingerprint(f, source, formula, digest):
+    """
+    fingerprint one opened stream
+    :return: FingerprintResult
+    """
+    fp,head,block = _parser()
+    n = _readinto(f, head)
+    md5 = None
+    if digest:
+        hash = hashlib.md5(memoryview(head)[:n])
+        view = memoryview(block)
+        while True:
+            m = _readinto(f, block)
+            if not m: break
+            hash.update(view[:m])
+        md5 = hash.hexdigest()
+    fp.formula = formula
+    fp.wfile.doc = {}
+    try:
+        fp.wfile._parse_buffer(head if n == len(head) else head[:n])
+    except IOError as e:
+        # short document still has its md5
+        return FingerprintResult(source, md5, False, None, Error(e.__class__.__name__, str(e)))
+    values = tuple([fp._eval_key(key) for key in formula])
+    return FingerprintResult(source, md5, fp.wfile.valid_doc(), values, None)
+
+def fingerprint_many(sources, formula=None, digest=True):
+    """
+    fingerprint documents
+    :param sources: iterable of filenames or opened binary streams [read from current position]
+    :param formula: list of keys, csv string or None for default formula
+    :param digest: calculate md5 of whole document
+    :return: list of FingerprintResult in sources order
+    """
+    formula = _formula(formula)
+    results = []
+    for source in sources:
+        name = source if isinstance(source, basestring) else getattr(source, 'name', repr(source))
+        try:
+            if isinstance(source, basestring):
+                with open(source, 'rb') as f:
+                    results.append(_fingerprint(f, name, formula, digest))
+            else:
+                results.append(_fingerprint(source, name, formula, digest))
+        except Exception as e:
+            results.append(FingerprintResult(name, None, False, None, Error(e.__class__.__name__, str(e))))
+    return results
+
+def correlate_many(refs, tests, formula=None, bits=False):
+    """
+    correlate every test document to every reference document
+    :param refs: list of FingerprintResult or sources [fingerprinted with formula]
+    :param tests: list of FingerprintResult or sources [fingerprinted with formula]
+    :param formula: formula the results were [or will be] fingerprinted with, None for default
+    :param bits: percentage of matching bits instead of matching keys
+    :return: list of CorrelationResult, for each ref all tests in order
+    """
+    formula = _formula(formula)
+    refs  = [r if isinstance(r, FingerprintResult) else fingerprint_many([r], formula, False)[0] for r in refs]
+    tests = [t if isinstance(t, FingerprintResult) else fingerprint_many([t], formula, False)[0] for t in tests]
+    widths = [wordfp.WordFingerprint.key_bits(key) for key in formula]
+    total = sum(widths) if bits else len(formula)
+    results = []
+    for ref in refs:
+        for tst in tests:
+            error = ref.error or tst.error
+            if error or len(ref.values) != len(formula) or len(tst.values) != len(formula):
+                error = error or Error('ValueError', 'fingerprint values do not match formula')
+                results.append(CorrelationResult(ref.source, tst.source, 0.0, 0, total, error))
+                continue
+            if bits:
+                matched = total - sum([wordfp.popcount((r ^ t) & ((1 << w) - 1)) for r,t,w in zip(ref.values, tst.values, widths)])
+            else:
+                matched = len([1 for r,t in zip(ref.values, tst.values) if r == t])
+            percent = 100.0 * matched / total if total > 0 else 0.0
+            results.append(CorrelationResult(ref.source, tst.source, percent, matched, total, None))
+    return results
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+
+"""
+=================
+ Word Background
+=================
+
+Word Background is helper module for W4C = Word Forensic Correlator = wor-for-cor = wor4cor = w4c
+
+Background model of fingerprint value frequencies built once from reference population [index].
+Identical installations produce identical fingerprints, so 100% match on common values means
+much less than match on rare ones. Fingerprint fields are not independent [builds of one
+installation come together], so model counts values of every subset of formula keys - exactly
+for single keys, low-order subsets and whole fingerprint, by count-min sketch sized to population
+for the rest - and estimates probability that random document of population matches reference
+document on exactly the matched keys combination [random match probability, likelihood ratio]
+without multiplying per-key frequencies.
+
+"""
+
+__author__  = 'Robert'
+__email__   = 'robert.puskajler@yahoo.ca'
+__version__ = '2.0.1'
+
+import hashlib
+import itertools
+import json
+import os
+import struct
+
+from wordfile import *
+import wordindex as wordidx
+
+# model file format identification
+BACKGROUND_FORMAT  = 'w4c-background'
+BACKGROUND_VERSION = 3
+
+# count-min sketch depth is fixed by 4 hashes taken from md5 digest
+SKETCH_DEPTH = 4
+# expected number of colliding entries per sketch cell, width is sized from population by it
+# [rows are sparse, so wide sketch costs no memory]
+SKETCH_EPSILON = 0.01
+
+# max formula keys for counting all key subsets [2^n - 1 updates per document],
+# longer formulas count only single keys and whole fingerprint tuple
+SUBSET_KEYS = 8
+# max subset keys counted exactly, higher-order subsets [except whole fingerprint] are sketched
+EXACT_KEYS = 3
+
+
+class BackgroundModel:
+    """
+    Fingerprint value frequencies of reference population
+    """
+
+    def __init__(self, formula, width=1):
+        """
+        empty model
+        :param formula: list of formula keys the model is built for
+        :param width: count-min sketch width [see sketch_width()]
+        :return:
+        """
+        self.formula = list(formula)
+        self.width   = max(1, width)
+        self.total   = 0
+        # key -> {value: count}
+        self.tables  = dict([(key, {}) for key in self.formula])
+        # subset name -> {values: count} of low-order subsets and whole fingerprint
+        self.counts  = {}
+        # count-min sketch of values of higher-order key subsets, sparse rows {cell: count}
+        self.sketch  = [{} for i in range(SKETCH_DEPTH)]
+
+    @classmethod
+    def subsets(cls, formula):
+        """
+        key subsets counted for every document [single keys are in tables]
+        :param formula: list of formula keys
+        :return: list of tuples of formula indexes
+        """
+        n = len(formula)
+        if n < 2:
+            return []
+        if n > SUBSET_KEYS:
+            return [tuple(range(n))]
+        return [c for size in range(2, n + 1) for c in itertools.combinations(range(n), size)]
+
+    @classmethod
+    def sketch_width(cls, total, formula, epsilon=SKETCH_EPSILON):
+        """
+        count-min sketch width for population keeping expected collisions per cell at epsilon
+        :param total: number of population documents
+        :param formula: list of formula keys
+        :param epsilon: expected number of colliding entries per cell
+        :return: int
+        """
+        sketched = [s for s in cls.subsets(formula) if not cls._exact(len(s), len(formula))]
+        return max(1, int(total * len(sketched) / epsilon))
+
+    @staticmethod
+    def _exact(size, n):
+        """
+        subset of size keys is counted exactly
+        :param size: number of subset keys
+        :param n: number of formula keys
+        :return: boolean
+        """
+        return size <= EXACT_KEYS or size == n
+
+    def _name(self, keys, values):
+        """
+        name of subset and its values
+        :param keys: subset of formula keys in formula order
+        :param values: values of keys
+        :return: tuple (subset name, values name)
+        """
+        return ','.join(keys), '-'.join(['%x' % v for v in values])
+
+    def _cells(self, keys, values):
+        """
+        sketch cell in every row for values of key subset
+        :param keys: subset of formula keys in formula order
+        :param values: values of keys
+        :return: list of column indexes
+        """
+        digest = hashlib.md5('%s=%s' % self._name(keys, values)).digest()
+        return [h % self.width for h in struct.unpack('<%dL' % SKETCH_DEPTH, digest)]
+
+    def _ordered(self, keys):
+        """
+        known keys in formula order
+        :param keys: formula keys
+        :return: list of keys
+        """
+        keys = set(keys)
+        return [key for key in self.formula if key in keys]
+
+    def add(self, fp):
+        """
+        add document of population, sketch cells are updated conservatively [only cells at the minimum]
+        :param fp: WordFingerprint instance
+        :return:
+        """
+        values = [fp._eval_key(key) for key in self.formula]
+        for key,value in zip(self.formula, values):
+            table = self.tables[key]
+            table[value] = table.get(value, 0) + 1
+        for subset in self.subsets(self.formula):
+            keys,vals = [self.formula[i] for i in subset], [values[i] for i in subset]
+            if self._exact(len(subset), len(self.formula)):
+                name,value = self._name(keys, vals)
+                counts = self.counts.setdefault(name, {})
+                counts[value] = counts.get(value, 0) + 1
+                continue
+            cells = self._cells(keys, vals)
+            count = min([self.sketch[row].get(cell, 0) for row,cell in enumerate(cells)]) + 1
+            for row,cell in enumerate(cells):
+                if self.sketch[row].get(cell, 0) < count:
+                    self.sketch[row][cell] = count
+        self.total += 1
+        return
+
+    def frequency(self, key, value):
+        """
+        number of population documents with key value
+        :return: int
+        """
+        return self.tables.get(key, {}).get(value, 0)
+
+    def tuple_frequency(self, values, keys=None):
+        """
+        number of population documents with values of keys [sketch estimate is never underestimated]
+        :param values: values of keys
+        :param keys: subset of formula keys in formula order, None for whole formula
+        :return: int
+        """
+        keys = self.formula if keys is None else list(keys)
+        if len(keys) == 1:
+            return self.frequency(keys[0], values[0])
+        if self._exact(len(keys), len(self.formula)):
+            name,value = self._name(keys, values)
+            return self.counts.get(name, {}).get(value, 0)
+        return min([self.sketch[row].get(cell, 0) for row,cell in enumerate(self._cells(keys, values))])
+
+    def counted(self, keys):
+        """
+        combination of keys is counted by model
+        :param keys: subset of formula keys in formula order
+        :return: boolean
+        """
+        return len(keys) <= 1 or len(self.formula) <= SUBSET_KEYS or keys == self.formula
+
+    def probability(self, fp, keys):
+        """
+        random match probability - estimated probability that random population document matches fp on keys,
+        counts are smoothed by one so unseen values are not impossible, keys unknown to model are ignored.
+        Combination of keys not counted by model [long formula] is bounded by its rarest key and never
+        goes below whole fingerprint count, so dependent fields do not overstate evidence.
+        :param fp: reference WordFingerprint instance
+        :param keys: matched formula keys
+        :return: float probability
+        """
+        n = self.total + 1.0
+        keys = self._ordered(keys)
+        if not keys: return 1.0
+        if self.counted(keys):
+            return (self.tuple_frequency([fp._eval_key(key) for key in keys], keys) + 1) / n
+        rarest = min([self.frequency(key, fp._eval_key(key)) for key in keys])
+        whole = self.tuple_frequency([fp._eval_key(key) for key in self.formula])
+        return (max(rarest, whole) + 1) / n
+
+    def save(self, fname):
+        """
+        save model to file
+        :param fname: model filename
+        :return:
+        """
+        data = {
+            'format':   BACKGROUND_FORMAT,
+            'version':  BACKGROUND_VERSION,
+            'formula':  self.formula,
+            'total':    self.total,
+            'width':    self.width,
+            'tables':   dict([(key, dict([('%x' % v, c) for v,c in table.items()])) for key,table in self.tables.items()]),
+            'counts':   self.counts,
+            'sketch':   [dict([('%d' % cell, c) for cell,c in row.items()]) for row in self.sketch]
+        }
+        tmp = '%s.%d.tmp' % (fname, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp, fname)
+        return
+
+    @classmethod
+    def load(cls, fname):
+        """
+        load model from file
+        :param fname: model filename
+        :return: BackgroundModel instance
+        """
+        with open(fname, 'r') as f:
+            data = json.load(f)
+        if data.get('format') != BACKGROUND_FORMAT or data.get('version') != BACKGROUND_VERSION:
+            raise ValueError('%s is not W4C background model version %d' % (fname, BACKGROUND_VERSION))
+        model = cls([str(key) for key in data['formula']], data['width'])
+        model.total  = data['total']
+        model.tables = dict([(str(key), dict([(int(v, 16), c) for v,c in table.items()])) for key,table in data['tables'].items()])
+        model.counts = dict([(str(name), dict([(str(v), c) for v,c in counts.items()])) for name,counts in data['counts'].items()])
+        model.sketch = [dict([(int(cell), c) for cell,c in row.items()]) for row in data['sketch']]
+        return model
+
+    @classmethod
+    def from_index(cls, index, formula, epsilon=SKETCH_EPSILON):
+        """
+        build model from population index, sketch width is sized from population size
+        :param index: WordIndex instance
+        :param formula: list of formula keys
+        :param epsilon: expected number of colliding entries per sketch cell
+        :return: BackgroundModel instance
+        """
+        model = cls(formula, cls.sketch_width(len(index), formula, epsilon))
+        for entry in index:
+            model.add(wordidx.WordIndex.fingerprint(entry))
+        return model
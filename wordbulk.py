@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+
+"""
+===========
+ Word Bulk
+===========
+
+Word Bulk is helper module for W4C = Word Forensic Correlator = wor-for-cor = wor4cor = w4c
+
+Bulk FIB decoder for corpus-scale work [requires numpy]. Header prefixes of many documents are
+read into one preallocated contiguous buffer, viewed as numpy structured dtype matching FIB
+offsets and all known_keys fields and magic validation are extracted for the whole batch
+in few vectorized operations. Batch is correlated to reference fingerprint directly on record
+columns [matching keys or bits] without building fingerprint of every document.
+
+"""
+
+__author__  = 'Robert'
+__email__   = 'robert.puskajler@yahoo.ca'
+__version__ = '2.0.1'
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from wordfile import *
+
+# default number of documents decoded in one batch
+CAPACITY = 4096
+
+
+def fib_dtype():
+    """
+    numpy structured dtype of document header - magic and all FIB fields at their file offsets
+    :return: numpy dtype with itemsize of WordFile.header_size()
+    """
+    fields = WordFile.field_offsets()
+    return numpy.dtype({
+        'names':    [key for key,offset,size in fields],
+        'formats':  ['<u%d' % size for key,offset,size in fields],
+        'offsets':  [offset for key,offset,size in fields],
+        'itemsize': WordFile.header_size()
+    })
+
+
+class BulkDecoder:
+    """
+    Batch decoder of document headers
+    """
+
+    def __init__(self, capacity=CAPACITY):
+        """
+        preallocate batch buffer
+        :param capacity: max number of documents in one batch
+        :return:
+        """
+        if numpy is None:
+            raise ImportError('bulk decoding requires numpy')
+        self.capacity = capacity
+        self.size     = WordFile.header_size()
+        self.dtype    = fib_dtype()
+        self.layout   = WordFile.field_offsets()
+        self.buff     = numpy.zeros((capacity, self.size), dtype=numpy.uint8)
+        self.lengths  = numpy.zeros(capacity, dtype=numpy.uint32)
+        self.errors   = {}
+
+    def read(self, paths):
+        """
+        read header prefixes of documents into batch buffer rows, short or unreadable documents are zero padded
+        and fields _parse_doc() does not read from short document are zeroed [missing field value is 0]
+        :param paths: list of at most capacity filenames
+        :return: number of documents in batch
+        """
+        n = len(paths)
+        if n > self.capacity:
+            raise ValueError('batch of %d documents exceeds capacity %d' % (n, self.capacity))
+        self.errors = {}
+        for i,path in enumerate(paths):
+            row = self.buff[i]
+            got = 0
+            try:
+                with open(path, 'rb') as f:
+                    got = f.readinto(row)
+            except IOError as e:
+                self.errors[i] = e
+            if got < self.size:
+                row[got:] = 0
+                for key,offset,size in self.layout[len(WordFile.fields_read(got)):]:
+                    row[offset:offset + size] = 0
+            self.lengths[i] = got
+        return n
+
+    def decode(self, n):
+        """
+        decode batch
+        :param n: number of documents in batch
+        :return: numpy structured array of n records [field name = key]
+        """
+        return self.buff[:n].view(self.dtype).reshape(n)
+
+    def valid(self, records):
+        """
+        vectorized valid_doc() - magic numbers [not read from short document they are zero]
+        :param records: decoded batch
+        :return: numpy boolean array
+        """
+        return (records[KEY_DOC_MAGIC] == OLE2_MAGIC) \
+            & (records[KEY_FIB_MAGIC] == FIB_MAGIC) \
+            & (records[KEY_CREATED_MAGIC] == WORD_MAGIC) \
+            & (records[KEY_SAVED_MAGIC] == WORD_MAGIC)
+
+    def fields(self, records, i):
+        """
+        fields of one document as WordFile.doc dictionary, of short document only fields _parse_doc() reads
+        :param records: decoded batch
+        :param i: document number in batch
+        :return: dictionary key -> value
+        """
+        doc = dict(zip(self.dtype.names, records[i].tolist()))
+        if self.lengths[i] < self.size:
+            return dict([(key, doc[key]) for key,offset,size in WordFile.fields_read(self.lengths[i])])
+        return doc
+
+    def column(self, records, key):
+        """
+        values of key for whole batch
+        :param records: decoded batch
+        :param key: keyname
+        :return: numpy uint64 array [all zero for unknown key]
+        """
+        if key not in self.dtype.names:
+            return numpy.zeros(len(records), dtype=numpy.uint64)
+        return records[key].astype(numpy.uint64)
+
+    def eval_key(self, records, key):
+        """
+        evaluate formula key over whole batch, logical operators are applied per record
+        :param records: decoded batch
+        :param key: keyname or logical expression
+        :return: numpy uint64 array
+        """
+        for oper in '^|&':
+            if oper not in key: continue
+            l,r = [self.column(records, x.strip()) for x in key.split(oper)]
+            if oper == '^': return l ^ r
+            if oper == '&': return l & r
+            if oper == '|': return l | r
+        return self.column(records, key)
+
+    def percent_match(self, records, fp, bits=False):
+        """
+        correlate fingerprint to whole batch - percentage of matching formula keys [or bits]
+        :param records: decoded batch
+        :param fp: reference WordFingerprint instance
+        :param bits: percentage of matching bits instead of matching keys
+        :return: tuple (numpy array of percentages, list of per formula key numpy boolean arrays of matches)
+        """
+        n = len(records)
+        widths = [fp.key_bits(key) for key in fp.formula]
+        total = sum(widths) if bits else len(fp.formula)
+        ok = numpy.zeros(n, dtype=numpy.uint32)
+        matches = []
+        for key,width in zip(fp.formula, widths):
+            diff = (self.eval_key(records, key) ^ numpy.uint64(fp._eval_key(key))) & numpy.uint64((1 << width) - 1)
+            matches.append(diff == 0)
+            if bits:
+                ok += width - numpy.unpackbits(diff.view(numpy.uint8)).reshape(n, 64).sum(axis=1, dtype=numpy.uint32)
+            else:
+                ok += matches[-1]
+        if total == 0: return numpy.zeros(n), matches
+        return 100.0 * ok / total, matches
+
+    def batches(self, paths):
+        """
+        read and decode documents batch by batch, buffer is reused so records are valid only until next batch
+        :param paths: list of filenames
+        :return: generator of tuples (batch filenames, records, valid array)
+        """
+        for start in range(0, len(paths), self.capacity):
+            chunk = paths[start:start + self.capacity]
+            records = self.decode(self.read(chunk))
+            yield chunk, records, self.valid(records)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+
+"""
+==============
+ Word Columns
+==============
+
+Word Columns is helper module for W4C = Word Forensic Correlator = wor-for-cor = wor4cor = w4c
+
+Versioned binary columnar fingerprint file. Every known_keys field is stored as fixed-width
+little-endian column followed by md5 digest and path table sections. File is opened by mmap
+and columns are read in place [numpy views when numpy is installed], so even large fingerprint
+sets are loaded without parsing and correlated directly against mapped columns [matching keys or bits].
+
+File layout, all sections aligned to 8 bytes:
+
+    header      magic, version, rows, columns, digest/path offsets and path data length
+    directory   per column: key name, width in bytes, data offset
+    columns     rows * width bytes per column
+    digest      rows * 16 bytes of md5 digest
+    path index  (rows + 1) * 8 bytes of offsets into path data
+    path data   utf-8 encoded paths
+
+"""
+
+__author__  = 'Robert'
+__email__   = 'robert.puskajler@yahoo.ca'
+__version__ = '2.0.1'
+
+import mmap
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from wordfile import *
+import wordfingerprint as wordfp
+
+# file format identification
+COLUMNS_MAGIC   = 'W4CCOLS\0'
+COLUMNS_VERSION = 1
+
+# header: magic, version, rows, columns, digest offset, path index offset, path data offset, path data length
+COLUMNS_HEAD = '<8sLLLQQQQ'
+# column directory entry: key name, width, data offset
+COLUMNS_DIR  = '<32sLQ'
+
+# md5 digest size
+DIGEST_SIZE = 16
+
+
+def _popcount64(x):
+    """
+    vectorized popcount of numpy uint64 array by byte lookup table
+    :param x: numpy uint64 array
+    :return: numpy uint32 array
+    """
+    table = numpy.array([bin(i).count('1') for i in range(256)], dtype=numpy.uint32)
+    return table[numpy.ascontiguousarray(x).view(numpy.uint8)].reshape(len(x), 8).sum(axis=1, dtype=numpy.uint32)
+
+def _align(pos, to=8):
+    return (pos + to - 1) // to * to
+
+def write_columns(fname, index):
+    """
+    write index entries as columnar file, written to temp file and renamed
+    :param fname: columnar filename
+    :param index: WordIndex instance or list of entries
+    :return: number of rows
+    """
+    entries = list(index)
+    rows = len(entries)
+    keys = [(k, s) for s in sorted(WordFile.known_keys, reverse=True) for k in WordFile.known_keys[s]]
+    paths = [e['path'].encode('utf-8') if isinstance(e['path'], unicode) else e['path'] for e in entries]
+    # section offsets
+    pos = _align(struct.calcsize(COLUMNS_HEAD) + len(keys) * struct.calcsize(COLUMNS_DIR))
+    offsets = []
+    for k,s in keys:
+        offsets.append(pos)
+        pos = _align(pos + rows * s)
+    digest_off = pos
+    pathidx_off = _align(digest_off + rows * DIGEST_SIZE)
+    pathdata_off = _align(pathidx_off + (rows + 1) * 8)
+    pathdata_len = sum([len(p) for p in paths])
+
+    tmp = '%s.%d.tmp' % (fname, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(struct.pack(COLUMNS_HEAD, COLUMNS_MAGIC, COLUMNS_VERSION, rows, len(keys),
+                            digest_off, pathidx_off, pathdata_off, pathdata_len))
+        for (k,s),off in zip(keys, offsets):
+            f.write(struct.pack(COLUMNS_DIR, k, s, off))
+        for (k,s),off in zip(keys, offsets):
+            f.seek(off)
+            frm = '<%d%s' % (rows, WordFile.size_format[s])
+            f.write(struct.pack(frm, *[e['fields'].get(k, 0) for e in entries]))
+        f.seek(digest_off)
+        f.write(''.join([e['md5'].decode('hex') for e in entries]))
+        f.seek(pathidx_off)
+        ends = [0]
+        for p in paths:
+            ends.append(ends[-1] + len(p))
+        f.write(struct.pack('<%dQ' % (rows + 1), *ends))
+        f.seek(pathdata_off)
+        f.write(''.join(paths))
+    os.rename(tmp, fname)
+    return rows
+
+
+class Column:
+    """
+    Read-only fixed-width column read in place from mapped file [used without numpy]
+    """
+
+    def __init__(self, buff, offset, width, rows):
+        self.buff   = buff
+        self.offset = offset
+        self.width  = width
+        self.rows   = rows
+        self.frm    = '<%s' % WordFile.size_format[width]
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.rows: raise IndexError(i)
+        return struct.unpack_from(self.frm, self.buff, self.offset + i * self.width)[0]
+
+    def __iter__(self):
+        for i in xrange(self.rows):
+            yield self[i]
+
+
+class ColumnFile:
+    """
+    Memory mapped columnar fingerprint file
+    """
+
+    def __init__(self, fname):
+        """
+        map columnar file and read header and column directory
+        :param fname: columnar filename
+        :return:
+        """
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic,version,self.rows,ncols,self.digest_off,self.pathidx_off,self.pathdata_off,self.pathdata_len = \
+            struct.unpack_from(COLUMNS_HEAD, self.mm)
+        if magic != COLUMNS_MAGIC or version != COLUMNS_VERSION:
+            raise ValueError('%s is not W4C columnar file version %d' % (fname, COLUMNS_VERSION))
+        self.directory = {}
+        pos = struct.calcsize(COLUMNS_HEAD)
+        for i in range(ncols):
+            key,width,offset = struct.unpack_from(COLUMNS_DIR, self.mm, pos)
+            self.directory[key.rstrip('\0')] = (width, offset)
+            pos += struct.calcsize(COLUMNS_DIR)
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, key):
+        """
+        column of key values, numpy array view when numpy is available
+        :param key: keyname
+        :return: sequence of rows values [all zero for unknown key]
+        """
+        if key not in self.directory:
+            return numpy.zeros(self.rows, dtype=numpy.uint64) if numpy else [0] * self.rows
+        width,offset = self.directory[key]
+        if numpy:
+            return numpy.frombuffer(self.mm, dtype='<u%d' % width, count=self.rows, offset=offset)
+        return Column(self.mm, offset, width, self.rows)
+
+    def path(self, i):
+        """
+        path of row
+        :param i: row number
+        :return: string
+        """
+        start,end = struct.unpack_from('<QQ', self.mm, self.pathidx_off + i * 8)
+        return self.mm[self.pathdata_off + start:self.pathdata_off + end].decode('utf-8')
+
+    def md5(self, i):
+        """
+        md5 hexdigest of row
+        :param i: row number
+        :return: string
+        """
+        off = self.digest_off + i * DIGEST_SIZE
+        return self.mm[off:off + DIGEST_SIZE].encode('hex')
+
+    def eval_key(self, key):
+        """
+        evaluate formula key over whole column, logical operators are applied per row
+        :param key: keyname or logical expression
+        :return: sequence of rows values
+        """
+        for oper in '^|&':
+            if oper not in key: continue
+            l,r = [self.column(x.strip()) for x in key.split(oper)]
+            if numpy:
+                l,r = l.astype(numpy.uint64), r.astype(numpy.uint64)
+                if oper == '^': return l ^ r
+                if oper == '&': return l & r
+                if oper == '|': return l | r
+            if oper == '^': return [a ^ b for a,b in zip(l, r)]
+            if oper == '&': return [a & b for a,b in zip(l, r)]
+            if oper == '|': return [a | b for a,b in zip(l, r)]
+        return self.column(key)
+
+    def percent_match(self, fp, bits=False):
+        """
+        correlate fingerprint to all rows - percentage of matching formula keys [or bits]
+        :param fp: reference WordFingerprint instance
+        :param bits: percentage of matching bits instead of matching keys
+        :return: sequence of rows percentages
+        """
+        widths = [fp.key_bits(key) for key in fp.formula]
+        total = sum(widths) if bits else len(fp.formula)
+        if total == 0: return [0.0] * self.rows
+        if numpy:
+            ok = numpy.zeros(self.rows, dtype=numpy.uint32)
+            for key,width in zip(fp.formula, widths):
+                if bits:
+                    diff = (self.eval_key(key).astype(numpy.uint64) ^ numpy.uint64(fp._eval_key(key))) & numpy.uint64((1 << width) - 1)
+                    ok += width - _popcount64(diff)
+                else:
+                    ok += self.eval_key(key) == fp._eval_key(key)
+            return 100.0 * ok / total
+        ok = [0] * self.rows
+        for key,width in zip(fp.formula, widths):
+            ref = fp._eval_key(key)
+            mask = (1 << width) - 1
+            for i,val in enumerate(self.eval_key(key)):
+                if bits:
+                    ok[i] += width - wordfp.popcount((val ^ ref) & mask)
+                elif val == ref:
+                    ok[i] += 1
+        return [100.0 * x / total for x in ok]
+
+    def close(self):
+        """
+        unmap file
+        :return:
+        """
+        self.mm.close()
+        return
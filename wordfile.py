@@ -86,6 +86,18 @@ class WordFile:
         1:  [ KEY_CREATED_ENV,  KEY_FLAGS_ENV ],
     }
 
+    # FIB fields in file order - (file offset, [keys read sequentially from offset])
+    fib_layout = [
+        (FIB_START,  [ KEY_FIB_MAGIC,       KEY_FIB_VER,        KEY_FIB_PVER,       KEY_LANG_STAMP,
+                       KEY_AUTO_TEXT,       KEY_FLAGS_DOC,      KEY_FIB_MIN,        KEY_HEAD_XOR,
+                       KEY_CREATED_ENV,     KEY_FLAGS_ENV,      KEY_CHARSET_DOC,    KEY_CHARSET_INT,
+                       KEY_TXT_OFFSET ]),
+        (FIB_RGW97,  [ KEY_CREATED_MAGIC,   KEY_SAVED_MAGIC,    KEY_CREATED_PRI,    KEY_SAVED_PRI ]),
+        (FIB_TAB97,  [ KEY_STLSHT_ORG,      KEY_STLSHT_ORG_N,   KEY_STLSHT,         KEY_STLSHT_N,
+                       KEY_FOOTREF,         KEY_FOOTREF_N ]),
+        (FIB_RGLW97, [ KEY_CREATED_BUILD,   KEY_SAVED_BUILD ]),
+    ]
+
     # size in bytes to struct format character
     size_format = {
         8:  'Q',
@@ -94,6 +106,13 @@ class WordFile:
         1:  'B'
     }
 
+    # class level caches built on first use - field table, header size, key formats, header struct and its keys
+    _fields = None
+    _header_size = None
+    _formats = None
+    _header_struct = None
+    _header_keys = None
+
     def __init__(self, docname):
         """
         constructor
@@ -110,10 +129,7 @@ class WordFile:
         :param key: keyname in ascii string
         :return:
         """
-        for size in self.known_keys:
-            if key in self.known_keys[size]:
-                return size
-        return 0
+        return self.size_of(key)
 
     def _key_to_format(self, key, frm='<%s'):
         """
@@ -122,6 +138,8 @@ class WordFile:
         :param frm: format string (endian)
         :return:
         """
+        if frm == '<%s' and key in self.key_formats():
+            return self.key_formats()[key]
         size = self._key_size(key)
         char = self.size_format.get(size)
         return frm % char
@@ -163,27 +181,10 @@ class WordFile:
         :param f: file
         :return: fills up internal dictionary doc
         """
-        # fib static
-        f.seek(FIB_START)
-        for k in [ KEY_FIB_MAGIC, KEY_FIB_VER, KEY_FIB_PVER, KEY_LANG_STAMP,
-            KEY_AUTO_TEXT, KEY_FLAGS_DOC, KEY_FIB_MIN, KEY_HEAD_XOR, KEY_CREATED_ENV, KEY_FLAGS_ENV,
-            KEY_CHARSET_DOC, KEY_CHARSET_INT, KEY_TXT_OFFSET ]:
+        for offset,keys in self.fib_layout:
+            f.seek(offset)
+            for k in keys:
                 self._read_key(f, k)
-        #
-        # fib dynamic short
-        f.seek(FIB_RGW97)
-        for k in [KEY_CREATED_MAGIC, KEY_SAVED_MAGIC, KEY_CREATED_PRI, KEY_SAVED_PRI]:
-            self._read_key(f, k)
-        #
-        # fib tab97
-        f.seek(FIB_TAB97)
-        for k in [KEY_STLSHT_ORG, KEY_STLSHT_ORG_N, KEY_STLSHT, KEY_STLSHT_N, KEY_FOOTREF, KEY_FOOTREF_N]:
-            self._read_key(f, k)
-        #
-        # fib dynamic long
-        f.seek(FIB_RGLW97)
-        for k in [KEY_CREATED_BUILD, KEY_SAVED_BUILD]:
-            self._read_key(f, k)
         return
 
     def _parse_doc(self, doc):
@@ -203,6 +204,147 @@ class WordFile:
 
         return
 
+    def _parse_stream(self, f):
+        """
+        parse ms word header from forward-only stream (pipe, stdin) - no seek on f
+        :param f: opened binary stream
+        :return: header bytes consumed from stream (caller may continue reading f)
+        """
+        head = ''
+        try:
+            head = self.read_header(f)
+            self._parse_buffer(head)
+        except IOError as e:
+            print e
+        except :
+            print traceback.format_exc()
+
+        return head
+
+    def _parse_buffer(self, buff):
+        """
+        parse magic and FIB from in-memory header buffer, values are unpacked in place,
+        from short buffer only fields read by _parse_doc() are unpacked and IOError is raised
+        :param buff: header bytes [str, bytearray, mmap], header_size() long for all fields
+        :return:
+        """
+        need = self.header_size()
+        if len(buff) >= need:
+            for key,value in zip(self.header_keys(), self.header_struct().unpack_from(buff)):
+                self.doc[key] = value
+            return
+        formats = self.key_formats()
+        for key,offset,size in self.fields_read(len(buff)):
+            self.doc[key] = struct.unpack_from(formats[key], buff, offset)[0]
+        raise IOError('short document header: %d bytes, %d expected' % (len(buff), need))
+
+    @classmethod
+    def field_offsets(cls):
+        """
+        file offsets of magic and all FIB fields
+        :return: list of tuples (key, offset, size in bytes) in read order [magic, then fib_layout]
+        """
+        if cls._fields is None:
+            fields = [(KEY_DOC_MAGIC, 0, cls.size_of(KEY_DOC_MAGIC))]
+            for offset,keys in cls.fib_layout:
+                for k in keys:
+                    fields.append((k, offset, cls.size_of(k)))
+                    offset += cls.size_of(k)
+            cls._fields = fields
+        return cls._fields
+
+    @classmethod
+    def fields_read(cls, length):
+        """
+        fields read from document of length bytes - sequential read of _parse_doc() stops at first field not fitting
+        :param length: number of available leading bytes of document
+        :return: list of tuples (key, offset, size in bytes) in read order
+        """
+        fields = []
+        for key,offset,size in cls.field_offsets():
+            if offset + size > length: break
+            fields.append((key, offset, size))
+        return fields
+
+    @classmethod
+    def header_size(cls):
+        """
+        number of leading file bytes needed to read magic and all FIB fields
+        :return: size in bytes
+        """
+        if cls._header_size is None:
+            cls._header_size = max([offset + size for key,offset,size in cls.field_offsets()])
+        return cls._header_size
+
+    @classmethod
+    def key_formats(cls):
+        """
+        little endian struct format of every known key
+        :return: dictionary key -> format
+        """
+        if cls._formats is None:
+            cls._formats = dict([(k, '<%s' % cls.size_format[size]) for size in cls.known_keys for k in cls.known_keys[size]])
+        return cls._formats
+
+    @classmethod
+    def header_struct(cls):
+        """
+        precompiled struct unpacking all fields of field_offsets() in one call, gaps are skipped as pad bytes
+        :return: struct.Struct instance [values in order of header_keys()]
+        """
+        if cls._header_struct is None:
+            frm = '<'
+            pos = 0
+            keys = []
+            for key,offset,size in sorted(cls.field_offsets(), key=lambda field: field[1]):
+                if offset < pos:
+                    raise ValueError('overlapping header field %s at offset %d' % (key, offset))
+                if offset > pos:
+                    frm += '%dx' % (offset - pos)
+                frm += cls.size_format[size]
+                keys.append(key)
+                pos = offset + size
+            cls._header_keys = keys
+            cls._header_struct = struct.Struct(frm)
+        return cls._header_struct
+
+    @classmethod
+    def header_keys(cls):
+        """
+        keys of values unpacked by header_struct() [file offset order]
+        :return: list of keys
+        """
+        cls.header_struct()
+        return cls._header_keys
+
+    @classmethod
+    def size_of(cls, key):
+        """
+        class level reverse lookup for known_keys - get key size in bytes by key name
+        :param key: keyname
+        :return: size in bytes, 0 for unknown key
+        """
+        for size in cls.known_keys:
+            if key in cls.known_keys[size]:
+                return size
+        return 0
+
+    @classmethod
+    def read_header(cls, f):
+        """
+        read exactly header_size() bytes from stream, pipes may return short reads
+        :param f: opened binary stream
+        :return: header bytes (shorter only on premature end of stream)
+        """
+        need = cls.header_size()
+        chunks = []
+        while need > 0:
+            chunk = f.read(need)
+            if not chunk: break
+            chunks.append(chunk)
+            need -= len(chunk)
+        return ''.join(chunks)
+
     def parsed(self):
         """
         doc was parsed into dictionary
@@ -243,6 +385,29 @@ class WordFile:
         self._parse_doc(self.docname)
         return
 
+    def parse_buffer(self, buff):
+        """
+        parse document from already read header bytes - wrapper for _parse_buffer(), handle errors
+        :param buff: header bytes, header_size() long for all fields
+        :return:
+        """
+        try:
+            self._parse_buffer(buff)
+        except IOError as e:
+            print e
+        except :
+            print traceback.format_exc()
+
+        return
+
+    def parse_stream(self, f):
+        """
+        parse document from non-seekable stream - wrapper for _parse_stream()
+        :param f: opened binary stream positioned at document start
+        :return: header bytes consumed from stream
+        """
+        return self._parse_stream(f)
+
     def hexdump(self):
         """
         dump parsed doc structure in hexa
@@ -18,9 +18,23 @@ __email__   = 'robert.puskajler@yahoo.ca'
 __version__ = '2.0.1'
 
 import hashlib
+import os
+import sys
 
 from wordfile import *
 
+# filename standing for standard input stream
+STDIN = '-'
+
+def popcount(x):
+    """
+    number of set bits
+    :param x: non negative integer
+    :return: int
+    """
+    return bin(x).count('1')
+
+
 class WordFingerprint:
     """
     Forensic MS Word file fingerprint
@@ -32,6 +46,12 @@ class WordFingerprint:
         KEY_SAVED_BUILD,  '%s^%s' % (KEY_STLSHT_N, KEY_FOOTREF)
     ]
 
+    # md5 read block size
+    buffsize = 65536
+
+    # md5 hexdigest already calculated while streaming
+    digest = None
+
     def __init__(self, fname=None):
         """
         initilize forensic fingerprint
@@ -46,19 +66,64 @@ class WordFingerprint:
         :param fname:
         :return:
         """
+        if fname == STDIN:
+            self.stream(self._stdin(), '<stdin>')
+            return
         self.fname = fname
+        self.digest = None
         self.wfile = WordFile(fname)
         self.wfile.parse()
 
+    def stream(self, f, name):
+        """
+        fingerprint forward-only stream (pipe, stdin) - buffers only header, md5 is calculated on the fly
+        :param f: opened binary stream positioned at document start
+        :param name: name shown instead of filename
+        :return:
+        """
+        self.fname = name
+        self.wfile = WordFile(name)
+        hash = hashlib.md5()
+        hash.update(self.wfile.parse_stream(f))
+        for block in iter(lambda: f.read(self.buffsize), ''):
+            hash.update(block)
+        self.digest = hash.hexdigest()
+        return
+
+    def header(self, name, head, digest=None):
+        """
+        fingerprint from header bytes already read by caller [prefetching reader]
+        :param name: document filename
+        :param head: header bytes or None when document could not be read
+        :param digest: md5 hexdigest of whole document if already calculated
+        :return:
+        """
+        self.fname = name
+        self.digest = digest
+        self.wfile = WordFile(name)
+        if head is not None:
+            self.wfile.parse_buffer(head)
+        return
+
+    def _stdin(self):
+        """
+        standard input switched to binary mode
+        :return: stdin stream
+        """
+        if sys.platform == 'win32':
+            import msvcrt
+            msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
+        return sys.stdin
+
     def md5(self):
         """
         calculate md5 hash
         :return:
         """
-        buffsize = 65536
+        if self.digest: return self.digest
         hash = hashlib.md5()
         with open(self.fname, 'rb') as f:
-            for block in iter(lambda: f.read(buffsize), ''):
+            for block in iter(lambda: f.read(self.buffsize), ''):
                 hash.update(block)
         return hash.hexdigest()
 
@@ -100,6 +165,31 @@ class WordFingerprint:
         """
         return glue.join([frm % self._eval_key(key) for key in self.formula])
 
+    def fp_bits(self):
+        """
+        forensic fingerprint packed into fixed-width bit vector, formula keys are concatenated msb first
+        :return: tuple (integer bit vector, width in bits)
+        """
+        bits = width = 0
+        for key in self.formula:
+            w = self.key_bits(key)
+            bits = (bits << w) | (self._eval_key(key) & ((1 << w) - 1))
+            width += w
+        return bits, width
+
+    @classmethod
+    def key_bits(cls, key):
+        """
+        width in bits of formula key, for logical expression width of the wider operand
+        :param key: keyname or logical expression
+        :return: int
+        """
+        for oper in '^|&':
+            if oper not in key: continue
+            l,r = key.split(oper)
+            return 8 * max(WordFile.size_of(l.strip()), WordFile.size_of(r.strip()))
+        return 8 * WordFile.size_of(key)
+
     def _eval_key(self, key):
         """
         evaluate key if logical operator is used
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+
+"""
+============
+ Word Index
+============
+
+Word Index is helper module for W4C = Word Forensic Correlator = wor-for-cor = wor4cor = w4c
+
+Self-contained fingerprint index files for sharded scan-and-merge processing.
+Each node scans its own shard of documents and writes partial index file
+to shared storage, partial indexes are later merged into single index.
+
+"""
+
+__author__  = 'Robert'
+__email__   = 'robert.puskajler@yahoo.ca'
+__version__ = '2.0.1'
+
+import bisect
+import cPickle
+import hashlib
+import json
+import os
+
+from wordfile import *
+import wordfingerprint as wordfp
+
+# index file format identification
+INDEX_FORMAT  = 'w4c-index'
+INDEX_VERSION = 1
+
+# BK-tree cache file suffix and format identification
+BKTREE_CACHE  = '.bkt'
+BKTREE_FORMAT = 'w4c-bktree-1'
+
+
+def parse_shard(spec):
+    """
+    parse shard specification i/n [1 <= i <= n]
+    :param spec: string like 2/8
+    :return: tuple (i, n)
+    """
+    try:
+        i,n = [int(x) for x in spec.split('/')]
+    except ValueError:
+        raise ValueError('invalid shard specification "%s", expected i/n' % spec)
+    if not 1 <= i <= n:
+        raise ValueError('invalid shard specification "%s", expected 1 <= i <= n' % spec)
+    return i,n
+
+def in_shard(path, shard):
+    """
+    check if document belongs to shard - by path hash, so nodes need no coordination
+    :param path: document filename
+    :param shard: tuple (i, n) or None for all documents
+    :return: boolean
+    """
+    if shard is None: return True
+    i,n = shard
+    h = hashlib.md5(os.path.normpath(path)).hexdigest()
+    return int(h, 16) % n == i - 1
+
+def parse_builds(spec):
+    """
+    parse build range lo:hi [hexa with 0x prefix or decimal], missing bound is open
+    :param spec: string like 0x1c2f:0x1d00
+    :return: tuple (lo, hi)
+    """
+    try:
+        lo,hi = [x.strip() for x in spec.split(':')]
+        return int(lo, 0) if lo else 0, int(hi, 0) if hi else 0xffffffff
+    except ValueError:
+        raise ValueError('invalid build range "%s", expected lo:hi' % spec)
+
+def read_manifest(fname):
+    """
+    read manifest file - one document filename per line, empty lines and # comments are skipped
+    :param fname: manifest filename
+    :return: generator of document filenames
+    """
+    with open(fname, 'r') as f:
+        for line in f:
+            path = line.strip()
+            if path and not path.startswith('#'):
+                yield path
+
+
+class WordIndex:
+    """
+    Index of parsed document fields and md5 hashes
+    """
+
+    def __init__(self, shard=None):
+        """
+        empty index
+        :param shard: tuple (i, n) this index was scanned for or None
+        :return:
+        """
+        self.shard   = shard
+        self.entries = []
+        self._seen   = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def add(self, fp):
+        """
+        add fingerprinted document
+        :param fp: WordFingerprint instance
+        :return: boolean if entry was added [False for duplicate]
+        """
+        return self.add_entry({
+            'path':     fp.fname,
+            'md5':      fp.md5(),
+            'valid':    fp.wfile.valid_doc(),
+            'fields':   dict(fp.wfile.doc)
+        })
+
+    def add_entry(self, entry):
+        """
+        add index entry, duplicates by path and md5 are ignored
+        :param entry: dictionary with keys path, md5, valid, fields
+        :return: boolean if entry was added
+        """
+        key = (entry['path'], entry['md5'])
+        if key in self._seen: return False
+        self._seen.add(key)
+        self.entries.append(entry)
+        return True
+
+    def merge(self, other):
+        """
+        merge other index into this one
+        :param other: WordIndex instance
+        :return: number of added entries
+        """
+        return len([e for e in other if self.add_entry(e)])
+
+    def save(self, fname):
+        """
+        save index to file, written to temp file and renamed so readers on shared storage never see partial file
+        :param fname: index filename
+        :return:
+        """
+        data = {
+            'format':   INDEX_FORMAT,
+            'version':  INDEX_VERSION,
+            'shard':    self.shard,
+            'formula':  wordfp.WordFingerprint.formula,
+            'entries':  self.entries
+        }
+        tmp = '%s.%d.tmp' % (fname, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(data, f, sort_keys=True)
+        os.rename(tmp, fname)
+        return
+
+    @classmethod
+    def load(cls, fname):
+        """
+        load index from file
+        :param fname: index filename
+        :return: WordIndex instance
+        """
+        with open(fname, 'r') as f:
+            data = json.load(f)
+        if data.get('format') != INDEX_FORMAT or data.get('version') != INDEX_VERSION:
+            raise ValueError('%s is not W4C index file version %d' % (fname, INDEX_VERSION))
+        shard = data.get('shard')
+        idx = cls(tuple(shard) if shard else None)
+        for entry in data['entries']:
+            entry['fields'] = dict([(str(k), v) for k,v in entry['fields'].items()])
+            idx.add_entry(entry)
+        return idx
+
+    @classmethod
+    def merge_files(cls, fnames):
+        """
+        merge partial index files into one index
+        :param fnames: list of index filenames
+        :return: WordIndex instance
+        """
+        idx = cls()
+        for fname in fnames:
+            idx.merge(cls.load(fname))
+        return idx
+
+    @classmethod
+    def fingerprint(cls, entry):
+        """
+        forensic fingerprint of index entry without reading document again
+        :param entry: index entry
+        :return: WordFingerprint instance
+        """
+        fp = wordfp.WordFingerprint()
+        fp.fname  = entry['path']
+        fp.digest = entry['md5']
+        fp.wfile  = WordFile(entry['path'])
+        fp.wfile.doc = dict(entry['fields'])
+        return fp
+
+
+class BuildTimeline:
+    """
+    Index entries sorted by installation and build for evolution queries
+
+    Entries are kept sorted by (lang.stamp, product.ver, created.priv, saved.priv, saved.build),
+    so documents of the same language and product version stay together ordered by installation
+    private fields and then by saved build. Build range query for one installation is bisection.
+    """
+
+    # fields identifying MS word installation
+    installation_keys = [ KEY_LANG_STAMP, KEY_FIB_PVER, KEY_CREATED_PRI, KEY_SAVED_PRI ]
+
+    def __init__(self, index):
+        """
+        build sorted timeline
+        :param index: WordIndex instance or list of entries
+        :return:
+        """
+        pairs = sorted([(self.installation(e) + (self._get(e, KEY_SAVED_BUILD), i), e) for i,e in enumerate(index)])
+        self.keys    = [k for k,e in pairs]
+        self.entries = [e for k,e in pairs]
+
+    @classmethod
+    def _get(cls, entry, key):
+        return entry['fields'].get(key, 0)
+
+    @classmethod
+    def installation(cls, entry):
+        """
+        installation key of index entry
+        :param entry: index entry
+        :return: tuple of installation_keys values
+        """
+        return tuple([cls._get(entry, k) for k in cls.installation_keys])
+
+    def between(self, entry, lo, hi):
+        """
+        documents of the same installation [private fields] as entry saved by builds lo..hi
+        :param entry: index entry or dictionary with key fields
+        :param lo: lowest saved.build
+        :param hi: highest saved.build
+        :return: list of index entries sorted by saved.build
+        """
+        inst = self.installation(entry)
+        start = bisect.bisect_left(self.keys, inst + (lo,))
+        end   = bisect.bisect_left(self.keys, inst + (hi + 1,))
+        return self.entries[start:end]
+
+    def timeline(self):
+        """
+        installation timeline - per installation list of clusters with the same saved.build in build order,
+        consecutive clusters are linked and link is bridged when document of later cluster was created
+        by the build of earlier cluster
+        :return: list of tuples (installation, [(saved.build, [entries], bridged)])
+        """
+        result = []
+        start = 0
+        while start < len(self.keys):
+            inst = self.keys[start][:len(self.installation_keys)]
+            end = bisect.bisect_left(self.keys, inst + (0xffffffff + 1,))
+            clusters = []
+            prev = None
+            for e in self.entries[start:end]:
+                build = self._get(e, KEY_SAVED_BUILD)
+                if prev != build:
+                    bridged = any([self._get(x, KEY_CREATED_BUILD) == prev for x in self.between(e, build, build)])
+                    clusters.append((build, [], bridged))
+                    prev = build
+                clusters[-1][1].append(e)
+            result.append((inst, clusters))
+            start = end
+        return result
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of packed fingerprints for hamming distance near-neighbour queries
+
+    Only subtrees with edge distance within d of query distance from node are visited,
+    so query for small d touches small part of the tree instead of full scan.
+    Nodes are kept in flat lists [node 0 is root], so the tree is cached to file next
+    to the index and loaded without rebuilding.
+    """
+
+    def __init__(self):
+        """
+        empty tree, node i is bits[i], items[i] and children[i] by distance
+        :return:
+        """
+        self.bits     = []
+        self.items    = []
+        self.children = []
+        self.size     = 0
+
+    def __len__(self):
+        return self.size
+
+    def _node(self, bits, item):
+        self.bits.append(bits)
+        self.items.append([item])
+        self.children.append({})
+        return len(self.bits) - 1
+
+    def add(self, bits, item):
+        """
+        add packed fingerprint
+        :param bits: integer bit vector
+        :param item: payload returned by search
+        :return:
+        """
+        self.size += 1
+        if not self.bits:
+            self._node(bits, item)
+            return
+        node = 0
+        while True:
+            d = wordfp.popcount(self.bits[node] ^ bits)
+            if d == 0:
+                self.items[node].append(item)
+                return
+            child = self.children[node].get(d)
+            if child is None:
+                self.children[node][d] = self._node(bits, item)
+                return
+            node = child
+
+    def search(self, bits, maxdist):
+        """
+        find fingerprints within maxdist bits
+        :param bits: integer bit vector
+        :param maxdist: max hamming distance
+        :return: list of tuples (distance, item) sorted by distance
+        """
+        result = []
+        stack = [0] if self.bits else []
+        while stack:
+            node = stack.pop()
+            d = wordfp.popcount(self.bits[node] ^ bits)
+            if d <= maxdist:
+                result.extend([(d, item) for item in self.items[node]])
+            for dist,child in self.children[node].items():
+                if d - maxdist <= dist <= d + maxdist:
+                    stack.append(child)
+        result.sort(key=lambda x: x[0])
+        return result
+
+    @classmethod
+    def from_index(cls, index):
+        """
+        tree of packed fingerprints [current formula] of index entries, payload is document path
+        :param index: WordIndex instance
+        :return: BKTree instance
+        """
+        tree = cls()
+        for entry in index:
+            tree.add(WordIndex.fingerprint(entry).fp_bits()[0], entry['path'])
+        return tree
+
+    @classmethod
+    def for_index(cls, indexfile):
+        """
+        tree for index file - loaded from cache file indexfile.bkt, built and cached
+        when cache is missing or index file or formula changed since
+        :param indexfile: index filename
+        :return: BKTree instance
+        """
+        cache = indexfile + BKTREE_CACHE
+        stamp = (os.path.getmtime(indexfile), os.path.getsize(indexfile))
+        formula = list(wordfp.WordFingerprint.formula)
+        try:
+            with open(cache, 'rb') as f:
+                data = cPickle.load(f)
+            if data['format'] == BKTREE_FORMAT and data['stamp'] == stamp and data['formula'] == formula:
+                tree = cls()
+                tree.bits, tree.items, tree.children, tree.size = data['nodes']
+                return tree
+        except (IOError, EOFError, KeyError, ValueError, cPickle.UnpicklingError):
+            pass
+        tree = cls.from_index(WordIndex.load(indexfile))
+        data = {
+            'format':   BKTREE_FORMAT,
+            'stamp':    stamp,
+            'formula':  formula,
+            'nodes':    (tree.bits, tree.items, tree.children, tree.size)
+        }
+        tmp = '%s.%d.tmp' % (cache, os.getpid())
+        with open(tmp, 'wb') as f:
+            cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, cache)
+        return tree
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+
+"""
+=============
+ Word Layout
+=============
+
+Word Layout is helper module for W4C = Word Forensic Correlator = wor-for-cor = wor4cor = w4c
+
+Orders documents by physical location on disk [first extent from FIEMAP, inode number as fallback]
+and hints kernel to read ahead headers of upcoming documents, so scanning evidence on spinning
+disks is mostly sequential instead of random seeks.
+
+"""
+
+__author__  = 'Robert'
+__email__   = 'robert.puskajler@yahoo.ca'
+__version__ = '2.0.1'
+
+import array
+import ctypes
+import ctypes.util
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# linux ioctl to get file extents
+FS_IOC_FIEMAP = 0xC020660B
+
+# struct fiemap header: start, length, flags, mapped extents, extent count, reserved
+FIEMAP_HEAD   = '=QQLLLL'
+# struct fiemap_extent: logical, physical, length, reserved64[2], flags, reserved[3]
+FIEMAP_EXTENT = '=QQQQQLLLL'
+# extent location not known yet [delayed allocation]
+FIEMAP_EXTENT_UNKNOWN = 0x2
+
+# posix_fadvise advice
+POSIX_FADV_WILLNEED = 3
+
+# number of upcoming documents with read ahead hint
+READ_AHEAD = 8
+
+
+def first_extent(path):
+    """
+    physical offset of first file extent
+    :param path: filename
+    :return: offset in bytes or None when FIEMAP is not supported
+    """
+    if fcntl is None: return None
+    buff = array.array('B', [0] * (struct.calcsize(FIEMAP_HEAD) + struct.calcsize(FIEMAP_EXTENT)))
+    struct.pack_into(FIEMAP_HEAD, buff, 0, 0, 0xffffffffffffffff, 0, 0, 1, 0)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd, FS_IOC_FIEMAP, buff, True)
+        finally:
+            os.close(fd)
+    except (IOError, OSError):
+        return None
+    if struct.unpack_from(FIEMAP_HEAD, buff)[3] == 0: return None
+    extent = struct.unpack_from(FIEMAP_EXTENT, buff, struct.calcsize(FIEMAP_HEAD))
+    if extent[5] & FIEMAP_EXTENT_UNKNOWN: return None
+    return extent[1]
+
+def disk_order(paths):
+    """
+    sort documents by device and physical offset, documents without extent info by inode,
+    documents which can not be stat-ed are kept at the end in original order
+    :param paths: list of filenames
+    :return: sorted list of filenames
+    """
+    keys = []
+    for i,path in enumerate(paths):
+        try:
+            st = os.stat(path)
+        except OSError:
+            keys.append(((1, 0, 0, 0, i), path))
+            continue
+        phys = first_extent(path)
+        if phys is None:
+            keys.append(((0, st.st_dev, 1, st.st_ino, i), path))
+        else:
+            keys.append(((0, st.st_dev, 0, phys, i), path))
+    return [path for key,path in sorted(keys)]
+
+def _libc_fadvise():
+    """
+    posix_fadvise from libc [python 2 os module does not provide it]
+    :return: function or None
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fadvise = libc.posix_fadvise
+    except (OSError, AttributeError):
+        return None
+    fadvise.argtypes = [ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong, ctypes.c_int]
+    return fadvise
+
+posix_fadvise = getattr(os, 'posix_fadvise', None) or _libc_fadvise()
+
+def read_ahead(path, size):
+    """
+    hint kernel to read ahead file header
+    :param path: filename
+    :param size: header size in bytes
+    :return:
+    """
+    if posix_fadvise is None: return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        posix_fadvise(fd, 0, size, POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+    return
+
+def ordered(paths, size, ahead=READ_AHEAD):
+    """
+    documents in disk order with read ahead hints for upcoming documents
+    :param paths: list of filenames
+    :param size: header size in bytes to read ahead
+    :param ahead: number of upcoming documents to hint
+    :return: generator of filenames
+    """
+    paths = disk_order(paths)
+    for path in paths[:ahead]:
+        read_ahead(path, size)
+    for i,path in enumerate(paths):
+        if i + ahead < len(paths):
+            read_ahead(paths[i + ahead], size)
+        yield path
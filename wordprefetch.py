@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+
+"""
+===============
+ Word Prefetch
+===============
+
+Word Prefetch is helper module for W4C = Word Forensic Correlator = wor-for-cor = wor4cor = w4c
+
+Concurrent prefetching reader for high-latency storage [SMB/NFS shares]. Pool of threads keeps
+reads of many documents in flight at once and passes completed header buffers to the parser,
+so throughput scales with queue depth instead of being bound by round trip time.
+
+Memory is bounded by (depth + buffers) headers, plus one md5 block per thread when md5 is
+calculated by the reader too.
+
+Benchmark with simulated latency [local delayed I/O]:
+
+    python wordprefetch.py latency_ms [doc1.doc doc2.doc ...]
+
+"""
+
+__author__  = 'Robert'
+__email__   = 'robert.puskajler@yahoo.ca'
+__version__ = '2.0.1'
+
+import hashlib
+import os
+import Queue
+import sys
+import tempfile
+import threading
+import time
+
+from wordfile import *
+
+# default number of concurrent reads
+DEPTH   = 16
+# default number of completed buffers waiting for parser
+BUFFERS = 64
+# md5 read block size
+BLOCK   = 65536
+
+
+def _pread(fd, size, offset):
+    """
+    pread replacement [python 2 os module does not provide it], fd has to be private to thread
+    :param fd: file descriptor
+    :param size: bytes to read
+    :param offset: file offset
+    :return: bytes
+    """
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+pread = getattr(os, 'pread', None) or _pread
+
+
+class Prefetcher:
+    """
+    Bounded concurrency document reader
+    """
+
+    def __init__(self, depth=DEPTH, buffers=BUFFERS, digest=True, reader=None):
+        """
+        configure reader
+        :param depth: number of reads in flight [threads]
+        :param buffers: max number of completed buffers not consumed yet
+        :param digest: calculate md5 of whole document in reader thread
+        :param reader: pread compatible function reader(fd, size, offset)
+        :return:
+        """
+        self.depth   = max(1, depth)
+        self.buffers = max(1, buffers)
+        self.digest  = digest
+        self.reader  = reader or pread
+        self.size    = WordFile.header_size()
+
+    def _read_full(self, fd, size, offset):
+        """
+        read size bytes, network file systems may return short reads
+        :return: bytes [shorter only at end of file]
+        """
+        chunks = []
+        while size > 0:
+            chunk = self.reader(fd, size, offset)
+            if not chunk: break
+            chunks.append(chunk)
+            size -= len(chunk)
+            offset += len(chunk)
+        return ''.join(chunks)
+
+    def _read(self, path):
+        """
+        read header and optionally md5 of whole document
+        :param path: filename
+        :return: tuple (path, header bytes, md5 hexdigest, error)
+        """
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            try:
+                head = self._read_full(fd, self.size, 0)
+                digest = None
+                if self.digest:
+                    hash = hashlib.md5(head)
+                    offset = len(head)
+                    for block in iter(lambda: self.reader(fd, BLOCK, offset), ''):
+                        hash.update(block)
+                        offset += len(block)
+                    digest = hash.hexdigest()
+            finally:
+                os.close(fd)
+        except (IOError, OSError) as e:
+            return path, None, None, e
+        return path, head, digest, None
+
+    def _worker(self, todo, done):
+        """
+        thread - read documents until todo queue is empty
+        :return:
+        """
+        while True:
+            try:
+                path = todo.get_nowait()
+            except Queue.Empty:
+                return
+            done.put(self._read(path))
+
+    def fetch(self, paths):
+        """
+        read documents concurrently
+        :param paths: list of filenames
+        :return: generator of tuples (path, header bytes, md5 hexdigest, error) in completion order
+        """
+        todo = Queue.Queue()
+        for path in paths:
+            todo.put(path)
+        done = Queue.Queue(self.buffers)
+        threads = []
+        for i in range(min(self.depth, len(paths))):
+            t = threading.Thread(target=self._worker, args=(todo, done))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for i in range(len(paths)):
+            yield done.get()
+        # workers are finishing, do not leave them to interpreter shutdown
+        for t in threads:
+            t.join()
+
+
+def delayed_reader(latency):
+    """
+    local stand-in for high-latency storage - every read waits latency seconds
+    :param latency: seconds
+    :return: pread compatible function
+    """
+    def reader(fd, size, offset):
+        time.sleep(latency)
+        return pread(fd, size, offset)
+    return reader
+
+def benchmark(paths, latency, depths=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    print prefetch throughput for queue depths with simulated latency
+    :param paths: list of filenames
+    :param latency: simulated latency per read in seconds
+    :param depths: queue depths to measure
+    :return:
+    """
+    print 'Prefetch %d documents, simulated latency %.1f ms per read' % (len(paths), latency * 1000)
+    print '%8s %10s %12s' % ('depth', 'seconds', 'docs/sec')
+    for depth in depths:
+        pf = Prefetcher(depth=depth, reader=delayed_reader(latency))
+        start = time.time()
+        for path,head,digest,error in pf.fetch(paths):
+            WordFile(path).parse_buffer(head)
+        elapsed = time.time() - start
+        print '%8d %10.3f %12.1f' % (depth, elapsed, len(paths) / elapsed)
+    return
+
+# ======
+#  MAIN
+# ======
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        print 'usage: %s latency_ms [doc1.doc doc2.doc ...]' % os.path.basename(sys.argv[0])
+        sys.exit(1)
+
+    latency = float(sys.argv[1]) / 1000
+    paths = sys.argv[2:]
+    tmpdir = None
+    # synthetic documents when none given
+    if not paths:
+        tmpdir = tempfile.mkdtemp(prefix='w4c-bench-')
+        for i in range(256):
+            path = os.path.join(tmpdir, 'doc%03d.doc' % i)
+            with open(path, 'wb') as f:
+                f.write('\0' * (4 * BLOCK))
+            paths.append(path)
+
+    benchmark(paths, latency)
+
+    if tmpdir:
+        for path in paths:
+            os.remove(path)
+        os.rmdir(tmpdir)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+
+"""
+============
+ Word Watch
+============
+
+Word Watch is helper module for W4C = Word Forensic Correlator = wor-for-cor = wor4cor = w4c
+
+Watches intake directory and reports new or changed files as soon as they are stable
+[size and mtime not changing], so only newly landed evidence is fingerprinted.
+Uses linux inotify when available, otherwise polls directory mtime [new files, only names
+not reported yet are checked] and re-stats already reported files [files overwritten in place].
+
+"""
+
+__author__  = 'Robert'
+__email__   = 'robert.puskajler@yahoo.ca'
+__version__ = '2.0.1'
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+# inotify event masks
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+
+# inotify event header: wd, mask, cookie, len
+IN_EVENT = 'iIII'
+
+
+class Watcher:
+    """
+    Intake directory watcher
+    """
+
+    def __init__(self, directory, interval=1.0):
+        """
+        start watching directory, files already present are reported as new
+        :param directory: intake directory
+        :param interval: seconds file has to keep the same size and mtime to be stable
+        :return:
+        """
+        self.directory = directory
+        self.interval  = interval
+        # name -> (size, mtime) of already reported files
+        self.seen    = {}
+        # name -> ((size, mtime), time of observation) of files waiting to become stable
+        self.pending = {}
+        self.dirmtime = None
+        self.fd = self._inotify()
+        for name in self._listdir():
+            self.pending[name] = None
+
+    def _inotify(self):
+        """
+        setup inotify watch on directory
+        :return: inotify file descriptor or None when inotify is not available
+        """
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init()
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, self.directory, IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def inotify(self):
+        """
+        inotify is used [otherwise polling fallback]
+        :return: boolean
+        """
+        return self.fd is not None
+
+    def _listdir(self):
+        """
+        list directory if its mtime changed since last listing [new/renamed/deleted file]
+        :return: list of filenames
+        """
+        mtime = os.stat(self.directory).st_mtime
+        if mtime == self.dirmtime: return []
+        self.dirmtime = mtime
+        return [name for name in os.listdir(self.directory) if not name.startswith('.')]
+
+    def _touched(self, timeout):
+        """
+        wait for names of created or changed files
+        :param timeout: seconds to wait, None to wait forever
+        :return: list of filenames
+        """
+        if not self.inotify():
+            time.sleep(self.interval if timeout is None else timeout)
+            # already reported files are re-stated by _changed, only new names of listing are pending
+            return [name for name in self._listdir() if name not in self.seen] + self._changed()
+        ready = select.select([self.fd], [], [], timeout)[0]
+        if not ready: return []
+        names = []
+        buff = os.read(self.fd, 65536)
+        hsize = struct.calcsize(IN_EVENT)
+        pos = 0
+        while pos + hsize <= len(buff):
+            wd,mask,cookie,length = struct.unpack_from(IN_EVENT, buff, pos)
+            name = buff[pos + hsize:pos + hsize + length].rstrip('\0')
+            if name and not name.startswith('.'):
+                names.append(name)
+            pos += hsize + length
+        return names
+
+    def _changed(self):
+        """
+        already reported files with changed size or mtime [overwritten in place], polling only -
+        such change does not change directory mtime, deleted files are forgotten
+        :return: list of filenames
+        """
+        changed = []
+        for name,sig in self.seen.items():
+            now = self._signature(name)
+            if now is None:
+                del self.seen[name]
+            elif now != sig and name not in self.pending:
+                changed.append(name)
+        return changed
+
+    def _signature(self, name):
+        """
+        file size and mtime
+        :param name: filename in directory
+        :return: tuple (size, mtime) or None for missing or non-regular file
+        """
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            return None
+        if not os.path.isfile(os.path.join(self.directory, name)): return None
+        return st.st_size, st.st_mtime
+
+    def _settled(self):
+        """
+        check pending files, report stable ones not reported yet with the same signature
+        :return: list of file paths
+        """
+        now = time.time()
+        stable = []
+        for name,last in self.pending.items():
+            sig = self._signature(name)
+            if sig is None:
+                del self.pending[name]
+                continue
+            if last is None or last[0] != sig:
+                self.pending[name] = (sig, now)
+                continue
+            if now - last[1] < self.interval:
+                continue
+            del self.pending[name]
+            if self.seen.get(name) != sig:
+                self.seen[name] = sig
+                stable.append(os.path.join(self.directory, name))
+        return sorted(stable)
+
+    def changes(self):
+        """
+        generator of stable new or changed files, runs forever
+        :return: file paths
+        """
+        while True:
+            for path in self._settled():
+                yield path
+            timeout = self.interval if self.pending else None
+            for name in self._touched(timeout):
+                self.pending.setdefault(name, None)
+
+    def close(self):
+        """
+        stop watching
+        :return:
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        return